@@ -0,0 +1,342 @@
+import os
+import hashlib
+import json
+import sqlite3
+import zipfile
+import fnmatch
+import mmap
+import struct
+import zlib
+from pathlib import Path
+import numpy as np
+import ctranslate2
+from faster_whisper import BatchedInferencePipeline, WhisperModel, decode_audio as decode_audio_file
+from faster_whisper.vad import VadOptions, get_speech_timestamps
+import tempfile
+import subprocess
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+# Whisper expects 16 kHz mono audio
+SAMPLE_RATE = 16000
+
+# Slide narration recorded by PowerPoint is stored as .m4a in the media folder
+SLIDE_AUDIO_PATTERN = 'ppt/media/*.m4a'
+
+# Whisper model used for every transcription; English-only tiny is plenty for close-mic
+# slide narration, set WHISPER_MODEL (e.g. "base") for harder audio
+MODEL_SIZE = os.getenv("WHISPER_MODEL", "tiny.en")
+
+# Slide transcriptions are cached in the output folder, keyed by audio content
+CACHE_FILENAME = 'transcription_cache.db'
+
+# Longest clip Whisper decodes in one pass
+CHUNK_SECONDS = 30
+
+# CTranslate2 threads given to each deck worker when running on CPU
+CPU_THREADS_PER_WORKER = 4
+
+# Decoding options shared by every transcription; a Silero VAD pass over each slide
+# runs first (see speech_clips) so silence never reaches the decoder, and every slide's
+# speech is then decoded in a single batched call per deck. Decoding is greedy (beam_size=1);
+# the batched pipeline already decodes each chunk once, without temperature fallback
+# or a previous-text prompt. Timestamp tokens stay on so VTT cues follow Whisper's
+# sentence-level segments rather than one cue per VAD chunk (up to 30 s).
+TRANSCRIBE_OPTIONS = dict(
+    batch_size=16,
+    beam_size=1,
+    without_timestamps=False,
+    vad_filter=True,
+    vad_parameters=dict(min_silence_duration_ms=500),
+)
+
+
+# Whisper model (CTranslate2 FP16 on GPU, INT8 on CPU), loaded lazily
+class WhisperManager:
+    """ Loads each Whisper model once, on first use, and shares it across calls """
+    _models = {}
+    _pipelines = {}
+    _lock = threading.Lock()
+    # Lowered per worker process when several decks share the CPU; also sizes the
+    # zip-read and ffmpeg decode thread pools so workers together stay within the cores
+    cpu_threads = os.cpu_count()
+
+    @classmethod
+    def get_model(cls, size=MODEL_SIZE):
+        with cls._lock:
+            if size not in cls._models:
+                gpu_count = ctranslate2.get_cuda_device_count()
+                if gpu_count:
+                    # FP16 on tensor cores, one decoding worker per visible GPU
+                    print(f"🧠 Loading Whisper model '{size}' on {gpu_count} GPU(s)...")
+                    cls._models[size] = WhisperModel(
+                        size, device="cuda", device_index=list(range(gpu_count)),
+                        compute_type="float16", num_workers=gpu_count
+                    )
+                else:
+                    print(f"🧠 Loading Whisper model '{size}' on CPU...")
+                    cls._models[size] = WhisperModel(size, device="cpu", compute_type="int8", cpu_threads=cls.cpu_threads)
+            return cls._models[size]
+
+    @classmethod
+    def get_pipeline(cls, size=MODEL_SIZE):
+        model = cls.get_model(size)
+        with cls._lock:
+            if size not in cls._pipelines:
+                cls._pipelines[size] = BatchedInferencePipeline(model=model)
+            return cls._pipelines[size]
+
+
+# A transcribed stretch of one slide, in seconds from the start of that slide
+Segment = namedtuple('Segment', 'start end text')
+
+
+class TranscriptionCache:
+    """ SQLite store of slide transcriptions, keyed by a BLAKE2 hash of the audio bytes,
+    the model size and the decoding options.
+
+    The cache is best-effort: if the database cannot be opened or used (bind mounts and
+    NFS shares often lack the shared memory WAL needs), transcription runs uncached.
+    """
+
+    def __init__(self, path, model_size=MODEL_SIZE):
+        options = json.dumps(TRANSCRIBE_OPTIONS, sort_keys=True).encode()
+        self._prefix = f"{model_size}:{hashlib.blake2b(options, digest_size=8).hexdigest()}:"
+        self._db = None
+        try:
+            self._db = sqlite3.connect(path, timeout=30)
+            # WAL lets deck workers read the cache while another one writes to it
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS transcriptions (key TEXT PRIMARY KEY, duration REAL, segments TEXT)"
+            )
+        except sqlite3.Error as e:
+            self._disable(e)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._db is not None:
+            self._db.close()
+
+    def _disable(self, error):
+        print(f"⚠️ Transcription cache unavailable, continuing without it: {error}")
+        if self._db is not None:
+            self._db.close()
+        self._db = None
+
+    def key(self, audio_bytes):
+        return self._prefix + hashlib.blake2b(audio_bytes, digest_size=16).hexdigest()
+
+    def get(self, key):
+        if self._db is None:
+            return None
+        try:
+            row = self._db.execute("SELECT duration, segments FROM transcriptions WHERE key = ?", (key,)).fetchone()
+        except sqlite3.Error as e:
+            self._disable(e)
+            return None
+        if row is None:
+            return None
+        duration, segments = row
+        return duration, [Segment(*segment) for segment in json.loads(segments)]
+
+    def put(self, key, duration, segments):
+        if self._db is None:
+            return
+        try:
+            with self._db:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO transcriptions VALUES (?, ?, ?)",
+                    (key, duration, json.dumps([tuple(segment) for segment in segments])),
+                )
+        except sqlite3.Error as e:
+            self._disable(e)
+
+
+def read_zip_member(zip_ref, pptx_map, file_info):
+    """ Reads one zip member; uncompressed (STORED) members are sliced straight out of the mapped deck """
+    if file_info.compress_type != zipfile.ZIP_STORED:
+        return zip_ref.read(file_info)
+
+    offset = file_info.header_offset
+    header = pptx_map[offset:offset + 30]
+    if header[:4] != b'PK\x03\x04':
+        raise zipfile.BadZipFile(f"Bad local header for {file_info.filename}")
+    name_length, extra_length = struct.unpack('<HH', header[26:30])
+    start = offset + 30 + name_length + extra_length
+    data = pptx_map[start:start + file_info.compress_size]
+    if zlib.crc32(data) != file_info.CRC:
+        raise zipfile.BadZipFile(f"Bad CRC-32 for {file_info.filename}")
+    return data
+
+
+def extract_audio_from_pptx(pptx_path):
+    """ Reads the slide audio of a PowerPoint presentation into memory as (name, bytes) pairs """
+    audio_files = []
+    corrupted_files = []
+
+    with open(pptx_path, 'rb') as pptx_file, zipfile.ZipFile(pptx_file, 'r') as zip_ref:
+        infos = [zip_ref.getinfo(name) for name in fnmatch.filter(zip_ref.namelist(), SLIDE_AUDIO_PATTERN)]
+        if not infos:
+            return []
+
+        # zipfile serializes only the raw file reads, so inflating runs concurrently across threads
+        with mmap.mmap(pptx_file.fileno(), 0, access=mmap.ACCESS_READ) as pptx_map, \
+                ThreadPoolExecutor(max_workers=WhisperManager.cpu_threads) as executor:
+            futures = [executor.submit(read_zip_member, zip_ref, pptx_map, info) for info in infos]
+            for file_info, future in zip(infos, futures):
+                try:
+                    audio_files.append((Path(file_info.filename).name, future.result()))
+                except zipfile.BadZipFile:
+                    print(f"⚠️ Corrupted file skipped: {file_info.filename}")
+                    corrupted_files.append(file_info.filename)
+
+    if corrupted_files:
+        print("\nThe following audio files were corrupted and could not be extracted:")
+        for f in corrupted_files:
+            print(f"- {f}")
+
+    return sorted(audio_files)
+
+
+def decode_audio(source, audio_bytes=b''):
+    """ Run ffmpeg on a path, or on 'pipe:0' fed with audio_bytes, and return 16 kHz mono float32 PCM """
+    result = subprocess.run(
+        ['ffmpeg', '-v', 'error', '-i', source,
+         '-f', 'f32le', '-ac', '1', '-ar', str(SAMPLE_RATE), '-'],
+        input=audio_bytes, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=False
+    )
+    if result.returncode != 0 or not result.stdout:
+        return None
+    return np.frombuffer(result.stdout, np.float32)
+
+
+def load_audio(name, audio_bytes):
+    """ Decode in-memory audio through an ffmpeg pipe, or None if unreadable """
+    try:
+        audio = decode_audio('pipe:0', audio_bytes)
+        if audio is None:
+            # An .m4a whose index (moov atom) follows the media data cannot be read from a pipe
+            with tempfile.TemporaryDirectory() as temp_folder:
+                temp_path = Path(temp_folder) / name
+                temp_path.write_bytes(audio_bytes)
+                audio = decode_audio(str(temp_path))
+        return audio
+    except Exception as e:
+        print(f"⚠️ Could not decode {name}: {e}")
+        return None
+
+
+def load_audio_files(audio_files):
+    """ Decode all (name, bytes) audio files concurrently; ffmpeg runs outside the GIL """
+    with ThreadPoolExecutor(max_workers=WhisperManager.cpu_threads) as executor:
+        return list(executor.map(load_audio, *zip(*audio_files)))
+
+
+def load_slides(audio_files, cache):
+    """ Resolves (name, bytes) audio files to (key, audio, duration, segments), or None when unreadable.
+
+    Cache hits come back with their stored segments and are never decoded (audio is None);
+    misses are decoded concurrently and come back with segments set to None.
+    """
+    keys = [cache.key(audio_bytes) for _, audio_bytes in audio_files]
+    hits = [cache.get(key) for key in keys]
+    misses = [audio_file for audio_file, hit in zip(audio_files, hits) if hit is None]
+    decoded = iter(load_audio_files(misses) if misses else [])
+
+    slides = []
+    for key, hit in zip(keys, hits):
+        if hit is not None:
+            duration, segments = hit
+            slides.append((key, None, duration, segments))
+            continue
+        audio = next(decoded)
+        slides.append(None if audio is None else (key, audio, len(audio) / SAMPLE_RATE, None))
+    return slides
+
+
+def speech_clips(audio):
+    """ Finds the speech in one slide's audio with Silero VAD and groups it into
+    (start, end) sample ranges of at most CHUNK_SECONDS each """
+    vad_options = VadOptions(**TRANSCRIBE_OPTIONS['vad_parameters'], max_speech_duration_s=CHUNK_SECONDS)
+    max_samples = CHUNK_SECONDS * SAMPLE_RATE
+    clips = []
+    for span in get_speech_timestamps(audio, vad_options, sampling_rate=SAMPLE_RATE):
+        # Merge spans into the previous clip while the whole clip still fits in one pass
+        if clips and span['end'] - clips[-1][0] <= max_samples:
+            clips[-1][1] = span['end']
+        else:
+            # Padding can push a span just past the limit; the pipeline would truncate it anyway
+            clips.append([span['start'], min(span['end'], span['start'] + max_samples)])
+    return clips
+
+
+def transcribe_slides(audios):
+    """ Transcribes the decoded audio of several slides in one batched pipeline call.
+
+    Returns one list of Segments per slide, timed from the start of that slide, dropping
+    any with blank text.
+    """
+    offsets = np.cumsum([0] + [len(audio) for audio in audios])
+    clip_timestamps = [
+        dict(start=(offset + start) / SAMPLE_RATE, end=(offset + end) / SAMPLE_RATE)
+        for audio, offset in zip(audios, offsets.tolist())
+        for start, end in speech_clips(audio)
+    ]
+    results = [[] for _ in audios]
+    if not clip_timestamps:
+        return results
+
+    # Every slide's speech is passed as explicit clips over the concatenated deck, so the
+    # pipeline skips its own VAD pass and batches clips from different slides together
+    options = {k: v for k, v in TRANSCRIBE_OPTIONS.items() if k not in ('vad_filter', 'vad_parameters')}
+    segments, info = WhisperManager.get_pipeline().transcribe(
+        np.concatenate(audios), clip_timestamps=clip_timestamps, **options
+    )
+
+    # Interior slide boundaries, with half a sample of slack because the pipeline rounds
+    # clip starts down to whole samples
+    slide_starts = (offsets / SAMPLE_RATE).tolist()
+    boundaries = (offsets[1:-1] - 0.5) / SAMPLE_RATE
+    for segment in segments:
+        # The batched pipeline yields every decoded chunk unfiltered, so noise or music that
+        # trips the VAD can come back as empty text
+        if not segment.text.strip():
+            continue
+        slide = int(np.searchsorted(boundaries, segment.start, side='right'))
+        start = slide_starts[slide]
+        results[slide].append(Segment(max(0.0, segment.start - start), segment.end - start, segment.text))
+    return results
+
+
+def transcribe_slide(audio):
+    """ Transcribes one slide, as decoded audio or an audio file path, into a list of Segments,
+    dropping any with blank text """
+    if isinstance(audio, str):
+        audio = decode_audio_file(audio, sampling_rate=SAMPLE_RATE)
+    return transcribe_slides([audio])[0]
+
+
+def format_times(seconds):
+    """ Format an array of seconds to VTT timestamps in one vectorized pass """
+    seconds = np.asarray(seconds, dtype=np.float64)
+    millis = ((seconds % 1) * 1000).astype(np.int64)
+    whole = seconds.astype(np.int64)
+    hours = whole // 3600
+    minutes = (whole // 60) % 60
+    whole %= 60
+    return ["%02d:%02d:%02d.%03d" % parts
+            for parts in zip(hours.tolist(), minutes.tolist(), whole.tolist(), millis.tolist())]
+
+
+def init_worker(worker_ids, gpu_count, cpu_threads):
+    """ Pins a worker process to one GPU and to its share of CPU threads before the model loads """
+    with worker_ids.get_lock():
+        worker_id = worker_ids.value
+        worker_ids.value += 1
+    if gpu_count:
+        os.environ["CUDA_VISIBLE_DEVICES"] = str(worker_id % gpu_count)
+    WhisperManager.cpu_threads = cpu_threads
@@ -1,99 +1,34 @@
 import os
-import zipfile
 from pathlib import Path
-import whisper
-import shutil
-import subprocess
-import ffmpeg
-
-# Initialize Whisper model
-model = whisper.load_model("base")
-
-# Check if we are running inside Docker
-if os.path.exists('/app'):
-    print("📦 Running inside Docker!")
+import ctranslate2
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from core import (
+    CACHE_FILENAME, CPU_THREADS_PER_WORKER, TranscriptionCache,
+    extract_audio_from_pptx, format_times, init_worker, load_slides, transcribe_slides,
+)
+
+# Output files are written one slide at a time through a 1 MiB buffer
+WRITE_BUFFER_SIZE = 1 << 20
+
+# Paths depend on whether we are running inside Docker. Only the constants live at module
+# level: spawned workers re-import this file, so printing and folder setup happen in main()
+IN_DOCKER = os.path.exists('/app')
+if IN_DOCKER:
     INPUT_FOLDER = '/app/ppt_Tst'
     OUTPUT_FOLDER = '/app/output'
 else:
-    print("💻 Running locally!")
     INPUT_FOLDER = 'C:/Users/beauc/Workspace/ppt_Tst'
     OUTPUT_FOLDER = 'C:/Users/beauc/Workspace/transcription/output'
 
-# Make sure the directories exist
-if not os.path.exists(INPUT_FOLDER):
-    raise FileNotFoundError(f"❌ Input folder not found: {INPUT_FOLDER}")
-if not os.path.exists(OUTPUT_FOLDER):
-    os.makedirs(OUTPUT_FOLDER)
-
-
-def extract_audio_from_pptx(pptx_path, output_folder):
-    """ Extracts audio files from a PowerPoint presentation """
-    temp_folder = Path(output_folder) / 'temp'
-    if temp_folder.exists():
-        shutil.rmtree(temp_folder)
-    temp_folder.mkdir(parents=True, exist_ok=True)
-
-    corrupted_files = []
-
-    with zipfile.ZipFile(pptx_path, 'r') as zip_ref:
-        for file_info in zip_ref.infolist():
-            if file_info.filename.startswith('ppt/media/') and file_info.filename.endswith(('.m4a', '.mp3', '.wav')):
-                try:
-                    zip_ref.extract(file_info, temp_folder)
-                except zipfile.BadZipFile:
-                    print(f"⚠️ Corrupted file skipped: {file_info.filename}")
-                    corrupted_files.append(file_info.filename)
-
-    if corrupted_files:
-        print("\nThe following audio files were corrupted and could not be extracted:")
-        for f in corrupted_files:
-            print(f"- {f}")
-
-    media_folder = temp_folder / 'ppt' / 'media'
-    if not media_folder.exists():
-        print("No media folder found.")
-        return []
-
-    audio_files = sorted(media_folder.glob('*.m4a'))
-    return audio_files
-
-
-def is_valid_audio(file_path):
-    """ Check if an audio file is playable with ffmpeg """
-    try:
-        result = subprocess.run(
-            ['ffmpeg', '-v', 'error', '-i', str(file_path), '-f', 'null', '-'],
-            stdout=subprocess.PIPE, stderr=subprocess.PIPE
-        )
-        return result.returncode == 0
-    except Exception as e:
-        print(f"Error validating audio: {e}")
-        return False
-
-
-def get_audio_duration(file_path):
-    """ Get the duration of an audio file using ffmpeg """
-    try:
-        probe = ffmpeg.probe(str(file_path))
-        duration = float(probe['format']['duration'])
-        return duration
-    except Exception as e:
-        print(f"⚠️ Could not retrieve duration for {file_path}: {e}")
-        return 0.0
-
-
-def is_silent_transcription(text):
-    """ Check if the transcription is empty or near-empty """
-    return len(text.strip()) == 0
-
-
-def format_time(seconds):
-    """ Format seconds to VTT timestamp """
-    millis = int((seconds % 1) * 1000)
-    seconds = int(seconds)
-    minutes = seconds // 60
-    hours = minutes // 60
-    return f"{hours:02}:{minutes % 60:02}:{seconds % 60:02}.{millis:03}"
+
+def setup_folders():
+    """ Reports where we are running and makes sure the input and output folders exist """
+    print("📦 Running inside Docker!" if IN_DOCKER else "💻 Running locally!")
+
+    if not os.path.exists(INPUT_FOLDER):
+        raise FileNotFoundError(f"❌ Input folder not found: {INPUT_FOLDER}")
+    Path(OUTPUT_FOLDER).mkdir(parents=True, exist_ok=True)
 
 
 def transcribe_and_merge(audio_files, output_folder, original_filename):
@@ -103,75 +38,109 @@ def transcribe_and_merge(audio_files, output_folder, original_filename):
 
     current_time = 0.0
 
-    with open(txt_path, 'w', encoding='utf-8') as txt_file, open(vtt_path, 'w', encoding='utf-8') as vtt_file:
-        vtt_file.write("WEBVTT\n\n")
-        
-        for index, audio_file in enumerate(audio_files, 1):
-            if not is_valid_audio(audio_file):
-                print(f"⚠️ Skipping corrupted or unreadable audio file: {audio_file}")
+    with TranscriptionCache(os.path.join(OUTPUT_FOLDER, CACHE_FILENAME)) as cache:
+        # Validate every slide up front so only usable audio reaches the model
+        valid = []
+        slides = load_slides(audio_files, cache)
+        for index, ((name, _), slide) in enumerate(zip(audio_files, slides), 1):
+            if slide is None:
+                print(f"⚠️ Skipping corrupted or unreadable audio file: {name}")
                 continue
 
-            duration = get_audio_duration(audio_file)
+            duration = slide[2]
             if duration < 1.0:
-                print(f"⚠️ Skipping {audio_file} — duration too short: {duration} seconds.")
+                print(f"⚠️ Skipping {name} — duration too short: {duration} seconds.")
                 continue
 
-            print(f"🔎 Transcribing {audio_file}...")
-            result = model.transcribe(str(audio_file))
-            transcribed_text = result['text']
+            valid.append((index, name, slide))
+
+        # Every slide missing from the cache goes through the model in one batched call
+        misses = [i for i, (_, _, slide) in enumerate(valid) if slide[3] is None]
+        if misses:
+            print(f"🔎 Transcribing {len(misses)} slide(s) of {original_filename}...")
+            transcribed = transcribe_slides([valid[i][2][1] for i in misses])
+            for i, segments in zip(misses, transcribed):
+                index, name, (key, audio, duration, _) = valid[i]
+                cache.put(key, duration, segments)
+                valid[i] = (index, name, (key, audio, duration, segments))
+
+        # Large buffers so each slide reaches the OS in as few writes as possible
+        with open(txt_path, 'w', encoding='utf-8', buffering=WRITE_BUFFER_SIZE) as txt_file, \
+                open(vtt_path, 'w', encoding='utf-8', buffering=WRITE_BUFFER_SIZE) as vtt_file:
+            vtt_file.write("WEBVTT\n\n")
+
+            for index, name, (key, audio, duration, segments) in valid:
+                if audio is None:
+                    print(f"♻️ Reusing cached transcription for {name}")
+
+                # No segments means the VAD found no speech, or the decoder returned only blank text
+                if not segments:
+                    print(f"⚠️ No speech detected in: {name}")
+                    continue
+
+                transcribed_text = "".join(segment.text for segment in segments)
+
+                # Write to .txt
+                txt_file.write(f"Slide {index}:\n{transcribed_text}\n\n")
+
+                # Write to .vtt
+                starts = format_times([current_time + segment.start for segment in segments])
+                ends = format_times([current_time + segment.end for segment in segments])
+                vtt_file.write("".join(
+                    f"{start} --> {end}\n{segment.text}\n\n" for segment, start, end in zip(segments, starts, ends)
+                ))
+            
+                # Accumulate the current time to keep VTT in sync
+                current_time += duration
 
-            if is_silent_transcription(transcribed_text):
-                print(f"⚠️ Transcription was empty for: {audio_file}")
-                continue
+    print(f"✅ Transcription saved as {txt_path} and {vtt_path}")
 
-            # Write to .txt
-            txt_file.write(f"Slide {index}:\n{transcribed_text}\n\n")
 
-            # Write to .vtt
-            for segment in result['segments']:
-                start = format_time(current_time + segment['start'])
-                end = format_time(current_time + segment['end'])
-                vtt_file.write(f"{start} --> {end}\n{segment['text']}\n\n")
-            
-            # Accumulate the current time to keep VTT in sync
-            current_time += duration
+def process_pptx(pptx_file):
+    """ Extracts, transcribes and saves a single presentation; shares no state with other decks """
+    print(f"Processing {pptx_file}...")
+    pptx_path = os.path.join(INPUT_FOLDER, pptx_file)
 
-    print(f"✅ Transcription saved as {txt_path} and {vtt_path}")
+    # Create output folder for this PPTX
+    original_filename = Path(pptx_file).stem
+    pptx_output_folder = os.path.join(OUTPUT_FOLDER, original_filename)
+    Path(pptx_output_folder).mkdir(parents=True, exist_ok=True)
+
+    audio_files = extract_audio_from_pptx(pptx_path)
+    if not audio_files:
+        print(f"No audio found in {pptx_file}.")
+        return
+
+    transcribe_and_merge(audio_files, pptx_output_folder, original_filename)
+
+    print(f"✅ Completed processing for {pptx_file}.")
 
 
 def main():
-    if not os.path.exists(OUTPUT_FOLDER):
-        os.makedirs(OUTPUT_FOLDER)
+    setup_folders()
 
-    pptx_files = [f for f in os.listdir(INPUT_FOLDER) if f.endswith('.pptx')]
+    pptx_files = [e.name for e in os.scandir(INPUT_FOLDER) if e.name.endswith('.pptx') and e.is_file()]
 
     if not pptx_files:
         print("No .pptx files found.")
         return
 
-    for pptx_file in pptx_files:
-        print(f"Processing {pptx_file}...")
-        pptx_path = os.path.join(INPUT_FOLDER, pptx_file)
-        
-        # Create output folder for this PPTX
-        original_filename = Path(pptx_file).stem
-        pptx_output_folder = os.path.join(OUTPUT_FOLDER, original_filename)
-        if not os.path.exists(pptx_output_folder):
-            os.makedirs(pptx_output_folder)
-
-        audio_files = extract_audio_from_pptx(pptx_path, pptx_output_folder)
-        if not audio_files:
-            print(f"No audio found in {pptx_file}.")
-            continue
-
-        transcribe_and_merge(audio_files, pptx_output_folder, original_filename)
-
-        # Clean up temporary files
-        temp_folder = os.path.join(pptx_output_folder, 'temp')
-        if os.path.exists(temp_folder):
-            shutil.rmtree(temp_folder)
-        
-        print(f"✅ Completed processing for {pptx_file}.")
+    # Decks are independent, so each one is handled by its own worker process.
+    # On GPU hosts every worker is pinned to one device; on CPU the cores are shared out.
+    gpu_count = ctranslate2.get_cuda_device_count()
+    workers = min(len(pptx_files), gpu_count or max(1, os.cpu_count() // CPU_THREADS_PER_WORKER))
+    cpu_threads = max(1, os.cpu_count() // workers)
+    # Spawned rather than forked so no CUDA state leaks from the parent
+    mp_context = multiprocessing.get_context('spawn')
+    worker_ids = mp_context.Value('i', 0)
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=mp_context,
+        initializer=init_worker,
+        initargs=(worker_ids, gpu_count, cpu_threads),
+    ) as executor:
+        list(executor.map(process_pptx, pptx_files))
 
     print("🚀 All files processed.")
 
@@ -1,116 +1,45 @@
 import os
-import zipfile
 from pathlib import Path
-import whisper
-import shutil
-import subprocess
-import ffmpeg
-
-# Initialize Whisper model
-model = whisper.load_model("base")
+import ctranslate2
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from core import (
+    CACHE_FILENAME, CPU_THREADS_PER_WORKER, TranscriptionCache,
+    extract_audio_from_pptx, format_times, init_worker, load_slides, transcribe_slides,
+)
 
 # Paths
 INPUT_FOLDER = 'C:/Users/beauc/Workspace/ppt_Tst'
 OUTPUT_FOLDER = 'C:/Users/beauc/Workspace/transcription/output'
 
 
-def extract_audio_from_pptx(pptx_path, output_folder):
-    """ Extracts audio files from a PowerPoint presentation """
-    temp_folder = Path(output_folder) / 'temp'
-    if temp_folder.exists():
-        shutil.rmtree(temp_folder)
-    temp_folder.mkdir(parents=True, exist_ok=True)
-
-    corrupted_files = []
-
-    with zipfile.ZipFile(pptx_path, 'r') as zip_ref:
-        for file_info in zip_ref.infolist():
-            if file_info.filename.startswith('ppt/media/') and file_info.filename.endswith(('.m4a', '.mp3', '.wav')):
-                try:
-                    zip_ref.extract(file_info, temp_folder)
-                except zipfile.BadZipFile:
-                    print(f"⚠️ Corrupted file skipped: {file_info.filename}")
-                    corrupted_files.append(file_info.filename)
-
-    if corrupted_files:
-        print("\nThe following audio files were corrupted and could not be extracted:")
-        for f in corrupted_files:
-            print(f"- {f}")
-
-    media_folder = temp_folder / 'ppt' / 'media'
-    if not media_folder.exists():
-        print("No media folder found.")
-        return []
-
-    audio_files = sorted(media_folder.glob('*.m4a'))
-    return audio_files
-
-
-def is_valid_audio(file_path):
-    """ Check if an audio file is playable with ffmpeg """
-    try:
-        result = subprocess.run(
-            ['ffmpeg', '-v', 'error', '-i', str(file_path), '-f', 'null', '-'],
-            stdout=subprocess.PIPE, stderr=subprocess.PIPE
-        )
-        return result.returncode == 0
-    except Exception as e:
-        print(f"Error validating audio: {e}")
-        return False
-
-
-def get_audio_duration(file_path):
-    """ Get the duration of an audio file using ffmpeg """
-    try:
-        probe = ffmpeg.probe(str(file_path))
-        duration = float(probe['format']['duration'])
-        return duration
-    except Exception as e:
-        print(f"⚠️ Could not retrieve duration for {file_path}: {e}")
-        return 0.0
-
-
-def is_silent_transcription(text):
-    """ Check if the transcription is empty or near-empty """
-    return len(text.strip()) == 0
-
-
-def format_time(seconds):
-    """ Format seconds to VTT timestamp """
-    millis = int((seconds % 1) * 1000)
-    seconds = int(seconds)
-    minutes = seconds // 60
-    hours = minutes // 60
-    return f"{hours:02}:{minutes % 60:02}:{seconds % 60:02}.{millis:03}"
-
-
-def transcribe_audio(audio_file, output_folder, slide_number):
-    """ Transcribes audio using Whisper and saves to .txt and .vtt """
+def transcribe_audio(name, output_folder, slide_number, slide):
+    """ Saves one slide's Whisper transcription to .txt and .vtt """
     
-    # Validate audio before transcribing
-    if not is_valid_audio(audio_file):
-        print(f"⚠️ Skipping corrupted or unreadable audio file: {audio_file}")
+    # Validate audio before transcribing (slide is None when ffmpeg failed)
+    if slide is None:
+        print(f"⚠️ Skipping corrupted or unreadable audio file: {name}")
         return
     
     # Check the duration before transcribing
-    duration = get_audio_duration(audio_file)
+    key, audio, duration, segments = slide
     if duration < 1.0:
-        print(f"⚠️ Skipping {audio_file} — duration too short: {duration} seconds.")
+        print(f"⚠️ Skipping {name} — duration too short: {duration} seconds.")
         return
     
-    print(f"🔎 Transcribing {audio_file}...")
-
-    # Perform transcription
-    result = model.transcribe(str(audio_file))
-    transcribed_text = result['text']
+    # Cache hits were never decoded
+    if audio is None:
+        print(f"♻️ Reusing cached transcription for {name}")
 
-    # Check if transcription is empty
-    if is_silent_transcription(transcribed_text):
-        print(f"⚠️ Transcription was empty for: {audio_file}")
+    # No segments means the VAD found no speech, or the decoder returned only blank text
+    if not segments:
+        print(f"⚠️ No speech detected in: {name}")
         return
+
+    transcribed_text = "".join(segment.text for segment in segments)
     
     # File naming
-    original_filename = audio_file.parent.parent.parent.name
+    original_filename = Path(output_folder).name
     output_filename_txt = f"{original_filename}_slide_{slide_number}.txt"
     output_filename_vtt = f"{original_filename}_slide_{slide_number}.vtt"
     text_file = os.path.join(output_folder, output_filename_txt)
@@ -121,51 +50,74 @@ def transcribe_audio(audio_file, output_folder, slide_number):
         f.write(transcribed_text)
     
     # Write to .vtt (WebVTT format)
+    starts = format_times([segment.start for segment in segments])
+    ends = format_times([segment.end for segment in segments])
     with open(vtt_file, 'w', encoding='utf-8') as f:
-        f.write("WEBVTT\n\n")
-        for segment in result['segments']:
-            start = format_time(segment['start'])
-            end = format_time(segment['end'])
-            text = segment['text']
-            f.write(f"{start} --> {end}\n{text}\n\n")
+        f.write("WEBVTT\n\n" + "".join(
+            f"{start} --> {end}\n{segment.text}\n\n" for segment, start, end in zip(segments, starts, ends)
+        ))
 
     print(f"✅ Transcription saved as {text_file} and {vtt_file}")
 
 
+def process_pptx(pptx_file):
+    """ Extracts, transcribes and saves a single presentation; shares no state with other decks """
+    print(f"Processing {pptx_file}...")
+    pptx_path = os.path.join(INPUT_FOLDER, pptx_file)
+
+    # Create output folder for this PPTX
+    original_filename = Path(pptx_file).stem
+    pptx_output_folder = os.path.join(OUTPUT_FOLDER, original_filename)
+    Path(pptx_output_folder).mkdir(parents=True, exist_ok=True)
+
+    audio_files = extract_audio_from_pptx(pptx_path)
+    if not audio_files:
+        print(f"No audio found in {pptx_file}.")
+        return
+
+    with TranscriptionCache(os.path.join(OUTPUT_FOLDER, CACHE_FILENAME)) as cache:
+        slides = load_slides(audio_files, cache)
+
+        # Every usable slide missing from the cache goes through the model in one batched call
+        misses = [i for i, slide in enumerate(slides) if slide is not None and slide[3] is None and slide[2] >= 1.0]
+        if misses:
+            print(f"🔎 Transcribing {len(misses)} slide(s) of {pptx_file}...")
+            for i, segments in zip(misses, transcribe_slides([slides[i][1] for i in misses])):
+                key, audio, duration, _ = slides[i]
+                cache.put(key, duration, segments)
+                slides[i] = (key, audio, duration, segments)
+
+    for index, ((name, _), slide) in enumerate(zip(audio_files, slides), 1):
+        transcribe_audio(name, pptx_output_folder, index, slide)
+
+    print(f"✅ Completed processing for {pptx_file}.")
+
+
 def main():
-    if not os.path.exists(OUTPUT_FOLDER):
-        os.makedirs(OUTPUT_FOLDER)
+    Path(OUTPUT_FOLDER).mkdir(parents=True, exist_ok=True)
 
-    pptx_files = [f for f in os.listdir(INPUT_FOLDER) if f.endswith('.pptx')]
+    pptx_files = [e.name for e in os.scandir(INPUT_FOLDER) if e.name.endswith('.pptx') and e.is_file()]
 
     if not pptx_files:
         print("No .pptx files found.")
         return
 
-    for pptx_file in pptx_files:
-        print(f"Processing {pptx_file}...")
-        pptx_path = os.path.join(INPUT_FOLDER, pptx_file)
-        
-        # Create output folder for this PPTX
-        original_filename = Path(pptx_file).stem
-        pptx_output_folder = os.path.join(OUTPUT_FOLDER, original_filename)
-        if not os.path.exists(pptx_output_folder):
-            os.makedirs(pptx_output_folder)
-
-        audio_files = extract_audio_from_pptx(pptx_path, pptx_output_folder)
-        if not audio_files:
-            print(f"No audio found in {pptx_file}.")
-            continue
-
-        for index, audio_file in enumerate(audio_files, 1):
-            transcribe_audio(audio_file, pptx_output_folder, index)
-        
-        # Clean up temporary files
-        temp_folder = os.path.join(pptx_output_folder, 'temp')
-        if os.path.exists(temp_folder):
-            shutil.rmtree(temp_folder)
-        
-        print(f"✅ Completed processing for {pptx_file}.")
+    # Decks are independent, so each one is handled by its own worker process.
+    # On GPU hosts every worker is pinned to one device; on CPU the cores are shared out.
+    gpu_count = ctranslate2.get_cuda_device_count()
+    workers = min(len(pptx_files), gpu_count or max(1, os.cpu_count() // CPU_THREADS_PER_WORKER))
+    cpu_threads = max(1, os.cpu_count() // workers)
+    # Spawned rather than forked so no CUDA state leaks from the parent
+    mp_context = multiprocessing.get_context('spawn')
+    worker_ids = mp_context.Value('i', 0)
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=mp_context,
+        initializer=init_worker,
+        initargs=(worker_ids, gpu_count, cpu_threads),
+    ) as executor:
+        list(executor.map(process_pptx, pptx_files))
 
     print("🚀 All files processed.")
 
@@ -1,7 +1,7 @@
 import zipfile
 import os
-import whisper
 import shutil
+from core import format_times, transcribe_slide
 
 # === UNZIP FUNCTION === #
 def unzip_pptx(pptx_path):
@@ -51,7 +51,7 @@ def auto_detect_pptx(folder_path):
         print(f"Provided path is not a folder: {folder_path}")
         return None
     
-    pptx_files = [f for f in os.listdir(folder_path) if f.endswith('.pptx')]
+    pptx_files = [e.name for e in os.scandir(folder_path) if e.name.endswith('.pptx') and e.is_file()]
     
     if len(pptx_files) == 0:
         print(f"No .pptx files found in: {folder_path}")
@@ -109,8 +109,6 @@ def transcribe_audio_files(audio_files):
     """
     Transcribes audio files using Whisper and saves .txt and .vtt files.
     """
-    model = whisper.load_model("base")
-    
     for file in audio_files:
         print(f"\n🔎 Transcribing {file}...")
 
@@ -131,44 +129,35 @@ def transcribe_audio_files(audio_files):
 
         # 🔎 Try transcribing
         try:
-            result = model.transcribe(abs_path)
+            segments = transcribe_slide(abs_path)
         except FileNotFoundError as e:
             print(f"Failed to transcribe {file}: {e}")
             continue
 
+        # No segments means the VAD found no speech, or the decoder returned only blank text
+        if not segments:
+            print(f"⚠️ No speech detected in: {file}")
+            continue
+
         # Generate text and VTT filenames
         text_path = abs_path.replace('.m4a', '.txt')
         vtt_path = abs_path.replace('.m4a', '.vtt')
 
         # Save transcription as .txt
         with open(text_path, 'w') as f:
-            f.write(result['text'])
+            f.write("".join(segment.text for segment in segments))
 
         # Save transcription as .vtt
+        starts = format_times([segment.start for segment in segments])
+        ends = format_times([segment.end for segment in segments])
         with open(vtt_path, 'w') as f:
-            f.write("WEBVTT\n\n")
-            for segment in result['segments']:
-                start = segment['start']
-                end = segment['end']
-                text = segment['text']
-                f.write(f"{format_time(start)} --> {format_time(end)}\n{text}\n\n")
+            f.write("WEBVTT\n\n" + "".join(
+                f"{start} --> {end}\n{segment.text}\n\n" for segment, start, end in zip(segments, starts, ends)
+            ))
 
         print(f"Transcription complete: {text_path}, {vtt_path}")
 
 
-# === TIME FORMAT FUNCTION === #
-def format_time(seconds):
-    """
-    Formats time in seconds to HH:MM:SS,ms format for VTT files.
-    """
-    ms = int((seconds % 1) * 1000)
-    seconds = int(seconds)
-    hours = seconds // 3600
-    minutes = (seconds % 3600) // 60
-    seconds = seconds % 60
-    return f"{hours:02}:{minutes:02}:{seconds:02}.{ms:03}"
-
-
 # === MAIN FUNCTION === #
 def main():
     path = input("Enter the path to your PowerPoint (.pptx) file or its folder: ")